@@ -1,6 +1,70 @@
+import argparse
+import logging
+from multiprocessing import Pool
+import numba
 import numpy as np
 from scipy.io.wavfile import write
 import os
+import sys
+
+try:
+    from signal_utils import absmax
+except ImportError:
+    if __name__ != '__main__':
+        raise
+    # Run as a script from its own folder, so the shared helpers in the repository
+    # root are not importable yet
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from signal_utils import absmax
+
+logger = logging.getLogger(__name__)
+
+@numba.njit(fastmath=True, cache=True)
+def sine_recurrence(freq, n, samplerate, phase=0.0):
+    """
+    Generate a sine wave with the two-term recurrence s[i] = 2*cos(w)*s[i-1] - s[i-2].
+
+    Only the first two samples are evaluated with sin(); every sample after that
+    costs one multiply and one subtract instead of a libm call.
+
+    Parameters:
+    - freq: Frequency (Hz) of the sine wave
+    - n: Number of samples to generate
+    - samplerate: Samples per second
+    - phase: Starting phase (radians)
+    """
+    omega = 2 * np.pi * freq / samplerate
+    k = 2 * np.cos(omega)
+    out = np.empty(n, dtype=np.float32)
+    # Keep the recurrence state in float64 so rounding does not accumulate
+    # into amplitude drift over long signals
+    s_prev = np.sin(phase - omega)
+    s_last = np.sin(phase)
+    if n > 0:
+        out[0] = s_last
+    for i in range(1, n):
+        s_prev, s_last = s_last, k * s_last - s_prev
+        out[i] = s_last
+    return out
+
+@numba.njit(parallel=True, fastmath=True, cache=True)
+def quantize_int16(signal, gains):
+    """
+    Apply a per-channel gain and convert to 16-bit PCM in one pass.
+
+    Parameters:
+    - signal: 2D array with shape (samples, channels), nominally within [-1, 1] after gain
+    - gains: Gain per channel
+
+    Returns:
+    - 2D int16 array with the same shape as signal
+    """
+    out = np.empty(signal.shape, dtype=np.int16)
+    for i in numba.prange(signal.shape[0]):
+        for j in range(signal.shape[1]):
+            v = np.rint(signal[i, j] * gains[j] * 32767)
+            out[i, j] = min(max(v, -32768), 32767)
+    return out
 
 def generate_binaural_beat(
     base_freq=200, 
@@ -17,105 +81,104 @@ def generate_binaural_beat(
     - duration: Duration in seconds
     - samplerate: Samples per second
     """
-    print(f"\nGenerating binaural beat with base frequency {base_freq}Hz and beat frequency {beat_freq}Hz:")
+    logger.info(f"\nGenerating binaural beat with base frequency {base_freq}Hz and beat frequency {beat_freq}Hz:")
     
     # Calculate the period of the beat frequency
     beat_period = 1.0 / beat_freq
     
     # Ensure duration is a multiple of the beat period
-    num_periods = int(duration / beat_period)
-    adjusted_duration = num_periods * beat_period
+    num_periods = int(duration * beat_freq)
+    adjusted_duration = num_periods / beat_freq
     
-    print(f"Adjusted duration to {adjusted_duration:.2f}s to align with beat period ({beat_period:.2f}s)")
+    logger.info(f"Adjusted duration to {adjusted_duration:.2f}s to align with beat period ({beat_period:.2f}s)")
     
-    # Generate time array
-    t = np.linspace(0, adjusted_duration, int(samplerate * adjusted_duration), endpoint=False)
+    # Count samples straight from the whole number of periods, rounding once, so
+    # float error in the adjusted duration cannot drop the final sample
+    n_samples = int(round(samplerate * num_periods / beat_freq))
     
     # Generate sine waves for left and right channels
-    left = np.sin(2 * np.pi * base_freq * t)
+    left = sine_recurrence(base_freq, n_samples, samplerate)
     # Add phase shift of pi to the right channel. This ensures the amplitude
     # envelope (beat) starts and ends at its minimum (zero crossing), 
     # which is useful for seamless looping.
-    right = np.sin(2 * np.pi * (base_freq + beat_freq) * t + np.pi)
+    right = sine_recurrence(base_freq + beat_freq, n_samples, samplerate, np.pi)
+    stereo_signal = np.stack((left, right), axis=-1)
+    
+    # Debug output only costs extra passes over the signal when it is enabled
+    debug = logger.isEnabledFor(logging.DEBUG)
     
-    # Debug print for signal before normalization
-    print(f"Left channel range before normalization: {np.min(left):.2e} to {np.max(left):.2e}")
-    print(f"Right channel range before normalization: {np.min(right):.2e} to {np.max(right):.2e}")
+    # Peak of each channel, from its range when that is being logged anyway
+    if debug:
+        channel_min = stereo_signal.min(axis=0)
+        channel_max = stereo_signal.max(axis=0)
+        logger.debug(f"Left channel range before normalization: {channel_min[0]:.2e} to {channel_max[0]:.2e}")
+        logger.debug(f"Right channel range before normalization: {channel_min[1]:.2e} to {channel_max[1]:.2e}")
+        channel_peak = np.maximum(-channel_min, channel_max)
+    else:
+        channel_peak = np.array([absmax(left), absmax(right)])
     
-    # Calculate RMS for each channel
-    left_rms = np.sqrt(np.mean(left**2))
-    right_rms = np.sqrt(np.mean(right**2))
-    print(f"Left channel RMS before normalization: {left_rms:.2e}")
-    print(f"Right channel RMS before normalization: {right_rms:.2e}")
+    # Calculate RMS for both channels in one pass
+    rms = np.sqrt(np.einsum('ij,ij->j', stereo_signal, stereo_signal, dtype=np.float64) / n_samples)
+    logger.debug(f"Left channel RMS before normalization: {rms[0]:.2e}")
+    logger.debug(f"Right channel RMS before normalization: {rms[1]:.2e}")
     
     # Normalize each channel to a target RMS value
     target_rms = 0.1  # Adjust this value to control overall volume
-    
-    if left_rms > 0:
-        left *= (target_rms / left_rms)
-    if right_rms > 0:
-        right *= (target_rms / right_rms)
-    
-    # Stack the normalized channels
-    stereo_signal = np.stack((left, right), axis=-1)
+    gains = np.divide(target_rms, rms, out=np.ones_like(rms), where=rms > 0)
     
     # Ensure no clipping
-    max_val = np.max(np.abs(stereo_signal))
+    max_val = np.max(channel_peak * gains)
     if max_val > 1.0:
-        stereo_signal /= max_val
+        gains /= max_val
     
-    # Debug print for final signal
-    print(f"Final stereo signal range: {np.min(stereo_signal):.2e} to {np.max(stereo_signal):.2e}")
-    print(f"Final left channel RMS: {np.sqrt(np.mean(stereo_signal[:, 0]**2)):.2e}")
-    print(f"Final right channel RMS: {np.sqrt(np.mean(stereo_signal[:, 1]**2)):.2e}")
+    # Debug output for final signal, derived from the gains rather than another pass
+    if debug:
+        logger.debug(f"Final stereo signal range: {np.min(channel_min * gains):.2e} to {np.max(channel_max * gains):.2e}")
+        logger.debug(f"Final left channel RMS: {rms[0] * gains[0]:.2e}")
+        logger.debug(f"Final right channel RMS: {rms[1] * gains[1]:.2e}")
 
     # Create filename and save the file
     filename = f"binaural_beat_{base_freq}Hz_L_{base_freq + beat_freq}Hz_R_{adjusted_duration:.2f}s.wav"
     script_dir = os.path.dirname(os.path.abspath(__file__))
     filename = os.path.join(script_dir, filename)
     
-    # Scale to 16-bit PCM format
-    scaled = np.int16(stereo_signal * 32767)
-    print(f"Scaled int16 range: {np.min(scaled)} to {np.max(scaled)}")
+    # Apply the gains and scale to 16-bit PCM format in a single pass
+    scaled = quantize_int16(stereo_signal, gains)
+    if debug:
+        logger.debug(f"Scaled int16 range: {np.min(scaled)} to {np.max(scaled)}")
     
     write(filename, samplerate, scaled)
-    print(f"Generated {filename}")
-
-if __name__ == '__main__':
-    # 30 Min Delta Nap
-    generate_binaural_beat(base_freq=90, beat_freq=1.5)
+    logger.info(f"Generated {filename}")
 
-    # Deep Delta Sleep
-    generate_binaural_beat(base_freq=100, beat_freq=2.0)
+# Presets as (base_freq, beat_freq)
+PRESETS = [
+    (90, 1.5),      # 30 Min Delta Nap
+    (100, 2.0),     # Deep Delta Sleep
+    (100, 4.0),     # Lucid Dream Induction (Theta)
+    (100, 6.0),     # Theta Chill
+    (100, 7.0),     # Evening Wind Down (High Theta)
+    (120, 10.0),    # Alpha Flow State
+    (136.1, 8.0),   # Healing Alpha Meditation (using 136.1 Hz base freq)
+    (140, 20.0),    # Morning Wake-Up Beat (High Beta)
+    (150, 5.5),     # Transcendental Meditation (Theta/Alpha edge)
+    (150, 14.0),    # Pomodoro Focus Burst (Alpha/Beta edge)
+    (180, 18.0),    # Mid Beta Power Boost
+    (200, 40.0),    # High Gamma Clarity
+]
 
-    # Lucid Dream Induction (Theta)
-    generate_binaural_beat(base_freq=100, beat_freq=4.0)
-    
-    # Theta Chill
-    generate_binaural_beat(base_freq=100, beat_freq=6.0)
+def configure_logging(verbose):
+    """Set up console logging; also runs in each worker process."""
+    logging.basicConfig(format='%(message)s', level=logging.INFO)
+    logger.setLevel(logging.DEBUG if verbose else logging.INFO)
 
-    # Evening Wind Down (High Theta)
-    generate_binaural_beat(base_freq=100, beat_freq=7.0)
-
-    # Alpha Flow State
-    generate_binaural_beat(base_freq=120, beat_freq=10.0)
-
-    # Healing Alpha Meditation (using 136.1 Hz base freq)
-    generate_binaural_beat(base_freq=136.1, beat_freq=8.0)
-
-    # Morning Wake-Up Beat (High Beta)
-    generate_binaural_beat(base_freq=140, beat_freq=20.0)
-
-    # Transcendental Meditation (Theta/Alpha edge)
-    generate_binaural_beat(base_freq=150, beat_freq=5.5)
-
-    # Pomodoro Focus Burst (Alpha/Beta edge)
-    generate_binaural_beat(base_freq=150, beat_freq=14.0)
-
-    # Mid Beta Power Boost
-    generate_binaural_beat(base_freq=180, beat_freq=18.0)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate loopable binaural beat audio files.')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Print signal statistics for each file')
+    args = parser.parse_args()
+    configure_logging(args.verbose)
 
-    # High Gamma Clarity
-    generate_binaural_beat(base_freq=200, beat_freq=40.0)
+    # Each preset writes its own file, so they can be generated in parallel
+    with Pool(initializer=configure_logging, initargs=(args.verbose,)) as pool:
+        pool.starmap(generate_binaural_beat, PRESETS)
 
-    print("\nDone! All files saved.")
\ No newline at end of file
+    print("\nDone! All files saved.")
@@ -47,33 +47,146 @@
         • 48000 Hz - Commonly used in video, film, and broadcast audio.
         • 96000+ Hz - Used in professional audio production (often overkill for basic use).
 
+# Performance
+
+    NumPy SIMD trig: The colored noise phases are generated with float32 np.cos/np.sin, which
+    NumPy 2.x dispatches at runtime to AVX2/AVX-512 (x86) or NEON (ARM) kernels.
+
+        • Builds without those kernels (e.g. some older conda packages) fall back to a scalar loop.
+        • The script checks this at import, reports it, and then draws trig-free noise phases instead.
+        • The binaural tones come from a sine lookup table and never call sin per sample.
+
+    FFTW: If pyFFTW is installed (`pip install pyfftw`), each chunk's inverse FFT runs through
+    one FFTW_MEASURE plan built for the chunk size and reused for every chunk.
+
+        • Planning measures a few candidate algorithms once, which adds a short delay up front.
+        • Without pyFFTW the script falls back to scipy.fft.
+
 """
+import functools
+import os
+import platform
+from concurrent.futures import ThreadPoolExecutor
+import numba
 import numpy as np
+import scipy.fft as sfft
 import soundfile as sf
 from tqdm import tqdm
+from signal_utils import absmax
+from wav_writer import RawWavAppender
+
+try:
+    import pyfftw
+except ImportError:  # Optional; scipy.fft is used instead
+    pyfftw = None
 
-def generate_sine_chunk(frequency, duration, samplerate, phase_offset):
+SYNTH_BLOCK = 4096  # Samples per parallel block in synth_chunk
+WRITE_BUFFERS = 3  # Output chunks in flight: one being synthesized, up to two being written
+
+# One full sine cycle plus a guard entry for interpolating the last segment. With linear
+# interpolation the error stays below 1e-6, far under 16-bit resolution.
+SIN_LUT_BITS = 12
+SIN_LUT = np.sin(np.linspace(0, 2 * np.pi, (1 << SIN_LUT_BITS) + 1)).astype(np.float32)
+
+def phase_increment(frequency, samplerate):
     """
-    Generate a sine wave chunk with continuous phase ensuring that each generated chunk continues smoothly from the last one, avoiding jumps or pops.
+    Convert a frequency to a per-sample step of a 32-bit phase accumulator.
+
+    A full cycle is 2^32, so the accumulator wraps exactly once per period and integer
+    phase never drifts. The step is rounded, which offsets the tone by at most
+    samplerate / 2^33 Hz (about 5 µHz at 44.1 kHz).
 
     Parameters:
-        frequency (float): Frequency of the sine wave in Hz.
-        duration (float): Duration of the chunk in seconds.
-        samplerate (int): Number of audio samples per second.
-        phase_offset (float): The current phase offset from the previous chunk (in radians).
-        
+        frequency (float): Tone frequency (Hz).
+        samplerate (int): Samples per second.
+
     Returns:
-        tuple:
-            - signal (np.ndarray): The generated sine wave chunk as a NumPy array.
-            - new_phase_offset (float): Updated phase offset to pass into the next chunk.
+        np.uint64: Phase step per sample, in units of 2^-32 cycles.
+    """
+    return np.uint64(round(frequency / samplerate * 2**32) % 2**32)
+
+@numba.njit(fastmath=True, boundscheck=False, cache=True)
+def lut_sine(out, start, dphase):
+    """
+    Fill `out` with a sine read from SIN_LUT at the 32-bit phase of each sample.
+
+    Each sample's phase is computed from its track index, not accumulated, so the loop
+    has no carried state and the tone is exact however long the track runs.
+
+    Parameters:
+        out (np.ndarray): float32 buffer to fill.
+        start (int): Index of the first sample within the whole track.
+        dphase (np.uint64): Phase step per sample from phase_increment.
     """
-    t = np.linspace(0, duration, int(samplerate * duration), endpoint=False)
-    phase = 2 * np.pi * frequency * t + phase_offset
-    signal = np.sin(phase)
-    # Calculate new phase offset
-    phase_increment = (2 * np.pi * frequency * duration) % (2 * np.pi)
-    new_phase_offset = (phase_offset + phase_increment) % (2 * np.pi)
-    return signal, new_phase_offset
+    frac_bits = 32 - SIN_LUT_BITS
+    frac_mask = (1 << frac_bits) - 1
+    frac_scale = np.float32(1.0 / (1 << frac_bits))
+    for j in range(out.shape[0]):
+        phase = ((start + j) * dphase) & 0xFFFFFFFF
+        idx = phase >> frac_bits
+        frac = np.float32(phase & frac_mask) * frac_scale
+        a = SIN_LUT[idx]
+        out[j] = a + frac * (SIN_LUT[idx + 1] - a)
+
+@numba.njit(fastmath=True, boundscheck=False, cache=True)
+def mix_to_i16(out_i16, left, right, noise, tone_scale, noise_scale):
+    """
+    Mix two tone blocks with one noise block and saturate them into interleaved int16.
+
+    The loop has no loop-carried state or branches, and saturates in float32 before the
+    integer cast, so LLVM vectorizes it into FMA, min/max, round and pack instructions.
+
+    Parameters:
+        out_i16 (np.ndarray): Flat int16 output buffer of interleaved left/right samples.
+        left (np.ndarray): Left tone samples.
+        right (np.ndarray): Right tone samples.
+        noise (np.ndarray): Noise shared by both channels.
+        tone_scale (float): Multiplier for the tones, including gain and int16 full scale.
+        noise_scale (float): Multiplier for the noise, including gain and int16 full scale.
+    """
+    lo = np.float32(-32768)
+    hi = np.float32(32767)
+    for i in range(left.shape[0]):
+        # Both ears share the same noise sample, so scale it once
+        scaled_noise = noise_scale * noise[i]
+        l = min(max(tone_scale * left[i] + scaled_noise, lo), hi)
+        r = min(max(tone_scale * right[i] + scaled_noise, lo), hi)
+        out_i16[2 * i] = np.int16(np.rint(l))
+        out_i16[2 * i + 1] = np.int16(np.rint(r))
+
+@numba.njit(parallel=True, fastmath=True, boundscheck=False, nogil=True, cache=True)
+def synth_chunk(out_i16, noise, dphase_l, dphase_r, start, tone_volume, noise_volume, gain):
+    """
+    Synthesize a stereo int16 chunk of binaural tones mixed with colored noise.
+
+    The chunk is processed in blocks of SYNTH_BLOCK samples in parallel. lut_sine fills
+    small float32 tone blocks from the integer phase of every sample, so blocks do not
+    depend on each other and the tones cannot drift however long the track is, and
+    mix_to_i16 then mixes them in a separate vectorizable pass.
+
+    Parameters:
+        out_i16 (np.ndarray): Output buffer with shape (samples, 2) and dtype int16.
+        noise (np.ndarray): Colored noise shared by both channels, one value per sample.
+        dphase_l (np.uint64): Phase step per sample of the left tone, from phase_increment.
+        dphase_r (np.uint64): Phase step per sample of the right tone, from phase_increment.
+        start (int): Index of the chunk's first sample within the whole track.
+        tone_volume (float): Volume multiplier for the binaural tones.
+        noise_volume (float): Volume multiplier for the colored noise.
+        gain (float): Overall gain applied to the mix before quantizing.
+    """
+    n = out_i16.shape[0]
+    interleaved = out_i16.reshape(-1)
+    # Fold the gain and int16 full scale into the two volumes up front
+    tone_scale = np.float32(tone_volume * gain * 32767)
+    noise_scale = np.float32(noise_volume * gain * 32767)
+    for block in numba.prange((n + SYNTH_BLOCK - 1) // SYNTH_BLOCK):
+        i0 = block * SYNTH_BLOCK
+        i1 = min(i0 + SYNTH_BLOCK, n)
+        left = np.empty(i1 - i0, dtype=np.float32)
+        right = np.empty(i1 - i0, dtype=np.float32)
+        lut_sine(left, start + i0, dphase_l)
+        lut_sine(right, start + i0, dphase_r)
+        mix_to_i16(interleaved[2 * i0:2 * i1], left, right, noise[i0:i1], tone_scale, noise_scale)
 
 def generate_binaural_beats(base_freq, beat_freq, duration, samplerate):
     """
@@ -88,11 +201,79 @@ def generate_binaural_beats(base_freq, beat_freq, duration, samplerate):
     Returns:
         tuple: (left_channel, right_channel) as numpy.ndarrays.
     """
-    left = generate_sine_tone(base_freq, duration, samplerate)
-    right = generate_sine_tone(base_freq + beat_freq, duration, samplerate)
+    n = int(samplerate * duration)
+    left = np.empty(n, dtype=np.float32)
+    right = np.empty(n, dtype=np.float32)
+    lut_sine(left, 0, phase_increment(base_freq, samplerate))
+    lut_sine(right, 0, phase_increment(base_freq + beat_freq, samplerate))
     return left, right
 
-def generate_colored_noise(duration, samplerate, exponent):
+def simd_sin_target():
+    """
+    Find the SIMD target NumPy dispatches float32 sin to on this machine.
+
+    Returns:
+        str or None: The dispatched target (e.g. 'AVX512F'), or None if sin runs a scalar loop.
+    """
+    try:
+        from numpy.lib.introspect import opt_func_info
+    except ImportError:  # NumPy < 2.1
+        return None
+    info = opt_func_info(func_name='^sin$', signature='float32').get('sin', {})
+    current = next(iter(info.values()), {}).get('current', '')
+    # The x86 baseline has no FMA, so NumPy does not vectorize sin there; ARM's baseline does
+    if not current or (current.startswith('baseline') and platform.machine() not in ('arm64', 'aarch64')):
+        return None
+    return current
+
+SIMD_SIN_TARGET = simd_sin_target()
+
+# PCG64 generator shared by every noise chunk
+_rng = np.random.default_rng()
+
+@functools.lru_cache(maxsize=8)
+def noise_amplitude(N, exponent, samplerate):
+    """
+    Compute the 1/f^(exponent/2) amplitude curve for an N-sample colored noise spectrum.
+
+    The curve only depends on its arguments, so it is cached and shared by every chunk.
+
+    Parameters:
+        N (int): Number of time-domain samples.
+        exponent (float): Controls the noise color.
+        samplerate (int): Samples per second.
+
+    Returns:
+        numpy.ndarray: Read-only float32 amplitude per rfft bin.
+    """
+    freqs = sfft.rfftfreq(N, d=1/samplerate).astype(np.float32)
+    freqs[0] = 1.0  # Prevent division by zero
+    amplitude = freqs ** (-exponent / 2)
+    amplitude.flags.writeable = False
+    return amplitude
+
+@functools.lru_cache(maxsize=2)
+def irfft_plan(N):
+    """
+    Build a reusable FFTW inverse real FFT plan for N-sample chunks.
+
+    The plan owns aligned complex64 input and float32 output buffers, so every chunk of the
+    same size reuses both the buffers and the measured algorithm.
+
+    Parameters:
+        N (int): Number of time-domain samples.
+
+    Returns:
+        pyfftw.FFTW or None: The plan, or None if pyFFTW is not installed.
+    """
+    if pyfftw is None:
+        return None
+    spectrum = pyfftw.empty_aligned(N // 2 + 1, dtype='complex64')
+    noise = pyfftw.empty_aligned(N, dtype='float32')
+    return pyfftw.FFTW(spectrum, noise, direction='FFTW_BACKWARD',
+                       flags=('FFTW_MEASURE',), threads=os.cpu_count())
+
+def generate_colored_noise(duration, samplerate, exponent, spectrum=None):
     """
     Generate colored noise using an FFT-based method.
     
@@ -105,18 +286,36 @@ def generate_colored_noise(duration, samplerate, exponent):
         duration (float): Duration in seconds.
         samplerate (int): Samples per second.
         exponent (float): Controls the noise color.
+        spectrum (numpy.ndarray): Optional complex64 scratch buffer of N//2 + 1 bins, reused across calls.
+            Ignored when pyFFTW is installed, since the FFTW plan owns its own buffer.
     
     Returns:
-        numpy.ndarray: Normalized time-domain noise.
+        numpy.ndarray: Normalized time-domain noise. With pyFFTW this is the plan's output
+            buffer, which the next call of the same size overwrites.
     """
     N = int(duration * samplerate)
-    freqs = np.fft.rfftfreq(N, d=1/samplerate)
-    freqs[0] = 1.0  # Prevent division by zero
-    phases = np.random.uniform(0, 2 * np.pi, len(freqs))
-    amplitude = 1 / (freqs ** (exponent / 2))
-    spectrum = amplitude * (np.cos(phases) + 1j * np.sin(phases))
-    noise = np.fft.irfft(spectrum, n=N)
-    return noise / np.max(np.abs(noise))
+    amplitude = noise_amplitude(N, exponent, samplerate)
+    plan = irfft_plan(N)
+    if plan is not None:
+        spectrum = plan.input_array
+    elif spectrum is None:
+        spectrum = np.empty(len(amplitude), dtype=np.complex64)
+    if SIMD_SIN_TARGET:
+        phases = _rng.random(len(amplitude), dtype=np.float32)
+        phases *= 2 * np.pi
+        np.cos(phases, out=spectrum.real)
+        np.sin(phases, out=spectrum.imag)
+    else:
+        # A normalized Gaussian pair is a unit phasor with uniform phase, and needs no sin/cos
+        _rng.standard_normal(dtype=np.float32, out=spectrum.view(np.float32))
+        spectrum /= np.abs(spectrum)
+    spectrum *= amplitude
+    if plan is not None:
+        noise = plan()
+    else:
+        noise = sfft.irfft(spectrum, n=N, workers=-1, overwrite_x=True)
+    noise /= absmax(noise)
+    return noise
 
 def mix_signals(signal1, volume1, signal2, volume2):
     """
@@ -146,26 +345,78 @@ def stack_channels(left, right):
     """
     return np.stack((left, right), axis=-1)
 
-def apply_fade(signal, samplerate, fade_time=0.02):
+@functools.lru_cache(maxsize=4)
+def fade_ramp(fade_samples):
     """
-    Apply a short fade-in and fade-out to a stereo signal.
+    Build a rising Hann half-window used for fades.
 
     Parameters:
-        signal (np.ndarray): 2D array with shape (samples, channels).
+        fade_samples (int): Length of the fade in samples.
+
+    Returns:
+        tuple:
+            - ramp (np.ndarray): Read-only float32 ramp with shape (fade_samples, 1), from 0 to 1.
+            - ramp_q15 (np.ndarray): The same ramp as Q15 fixed point (int32), for int16 signals.
+    """
+    ramp = (np.sin(0.5 * np.pi * np.linspace(0, 1, fade_samples)) ** 2)[:, np.newaxis]
+    ramp_q15 = np.rint(ramp * 32768).astype(np.int32)
+    ramp = ramp.astype(np.float32)
+    ramp.flags.writeable = False
+    ramp_q15.flags.writeable = False
+    return ramp, ramp_q15
+
+def apply_fade(signal, samplerate, fade_time=0.02, fade_in=True, fade_out=True):
+    """
+    Apply a short Hann fade-in and/or fade-out to a stereo signal.
+
+    Int16 PCM is faded in fixed point, so it never goes through float.
+
+    Parameters:
+        signal (np.ndarray): 2D float or int16 array with shape (samples, channels).
         samplerate (int): Number of samples per second.
         fade_time (float): Duration of the fade (in seconds).
+        fade_in (bool): Whether to fade in the start of the signal.
+        fade_out (bool): Whether to fade out the end of the signal.
 
     Returns:
         np.ndarray: The faded signal.
     """
     fade_samples = int(samplerate * fade_time)
-    fade_in = np.linspace(0, 1, fade_samples)[:, np.newaxis] 
-    fade_out = np.linspace(1, 0, fade_samples)[:, np.newaxis]
-    
-    signal[:fade_samples] *= fade_in
-    signal[-fade_samples:] *= fade_out
+    ramp, ramp_q15 = fade_ramp(fade_samples)
+    for enabled, region, window in ((fade_in, signal[:fade_samples], slice(None)),
+                                    (fade_out, signal[-fade_samples:], slice(None, None, -1))):
+        if not enabled:
+            continue
+        if signal.dtype == np.int16:
+            # Round to nearest rather than floor, so the result is within 1 LSB of a float fade
+            region[:] = (region * ramp_q15[window] + (1 << 14)) >> 15
+        else:
+            region *= ramp[window]
     return signal
 
+def blend_noise_seam(noise, previous_head, ramp):
+    """
+    Crossfade the start of a noise chunk from the start of the previous noise chunk.
+
+    Each noise chunk comes out of an inverse FFT and is periodic, so the first samples of
+    the previous chunk are the seamless continuation of its last ones. Fading from those
+    into the new chunk hides the jump at the chunk boundary.
+
+    Parameters:
+        noise (np.ndarray): The new noise chunk, blended in place.
+        previous_head (np.ndarray): The first len(ramp) samples of the previous chunk.
+        ramp (np.ndarray): Fade-in ramp from 0 to 1.
+
+    Returns:
+        np.ndarray: The unblended head of `noise`, to pass as `previous_head` for the next chunk.
+    """
+    head = noise[:len(ramp)]
+    new_head = head.copy()
+    head -= previous_head
+    head *= ramp
+    head += previous_head
+    return new_head
+
 def normalize_signal(signal):
     """
     Normalize a signal to ensure its maximum amplitude is 1.
@@ -176,7 +427,7 @@ def normalize_signal(signal):
     Returns:
         numpy.ndarray: Normalized signal.
     """
-    max_val = np.max(np.abs(signal))
+    max_val = absmax(signal)
     return signal if max_val == 0 else signal / max_val
 
 def generate_filename(base_freq, beat_freq, noise_exponent, tone_volume, noise_volume, duration):
@@ -198,8 +449,11 @@ def write_wav_file(filename, samplerate, stereo_signal):
         samplerate (int): Samples per second.
         stereo_signal (numpy.ndarray): 2D array with shape (samples, 2).
     """
-    signal_int16 = (stereo_signal * 32767).astype(np.int16)
-    write(filename, samplerate, signal_int16)
+    # Scale straight into the int16 buffer instead of via a scaled float copy
+    signal_int16 = np.empty(stereo_signal.shape, dtype=np.int16)
+    np.multiply(stereo_signal, 32767, out=signal_int16, casting='unsafe')
+    with RawWavAppender(filename, samplerate, channels=2) as wav:
+        wav.append(signal_int16)
     print(f"Exported '{filename}'.")
 
 def generate_layered_binaural_noise_chunked(
@@ -233,21 +487,53 @@ def generate_layered_binaural_noise_chunked(
     chunk_size = int(samplerate * chunk_duration)
     total_chunks = int(duration / chunk_duration)
 
-    # Phase offsets for smooth sine continuity
-    phase_offset_left = 0.0
-    phase_offset_right = 0.0
+    print(f"NumPy float32 sin/cos: {SIMD_SIN_TARGET or 'scalar, using trig-free noise phases'}")
+    print(f"Inverse FFT: {'FFTW' if pyfftw is not None else 'scipy.fft'}")
+
+    # Scratch spectrum shared by every noise chunk
+    spectrum = np.empty(chunk_size // 2 + 1, dtype=np.complex64)
+
+    # Output buffers rotated between synthesis and the background writer
+    stereo_chunks = [np.empty((chunk_size, 2), dtype=np.int16) for _ in range(WRITE_BUFFERS)]
+    pending_writes = [None] * WRITE_BUFFERS
+
+    # Tones peak at tone_volume and the peak-normalized noise at noise_volume, so one
+    # fixed gain prevents clipping and keeps the loudness identical across chunks
+    headroom = tone_volume + noise_volume
+    gain = 1.0 / headroom if headroom > 0 else 1.0
+
+    # Ramp used to crossfade the noise across chunk boundaries
+    seam_ramp = np.linspace(0, 1, int(samplerate * 0.02), dtype=np.float32)
+    noise_head = None
+
+    dphase_left = phase_increment(base_freq, samplerate)
+    dphase_right = phase_increment(base_freq + beat_freq, samplerate)
     
-    with sf.SoundFile(filename, mode='w', samplerate=samplerate, channels=2, format='WAV') as f:
-        for _ in tqdm(range(total_chunks), desc="Generating Audio", unit="chunk"):
-            left_tone, phase_offset_left = generate_sine_chunk(base_freq, chunk_duration, samplerate, phase_offset_left)
-            right_tone, phase_offset_right = generate_sine_chunk(base_freq + beat_freq, chunk_duration, samplerate, phase_offset_right)
-            colored_noise = generate_colored_noise(chunk_duration, samplerate, noise_exponent)
-            left_channel = mix_signals(left_tone, tone_volume, colored_noise, noise_volume)
-            right_channel = mix_signals(right_tone, tone_volume, colored_noise, noise_volume)
-            stereo_chunk = stack_channels(left_channel, right_channel)
-            stereo_chunk = apply_fade(stereo_chunk, samplerate, fade_time=0.02)
-            stereo_chunk = normalize_signal(stereo_chunk)
-            f.write(stereo_chunk)
+    # A single writer thread flushes finished chunks to disk while the next one is
+    # synthesized; soundfile and the Numba kernel both release the GIL
+    with sf.SoundFile(filename, mode='w', samplerate=samplerate, channels=2, format='WAV') as f, \
+            ThreadPoolExecutor(max_workers=1) as writer:
+        for chunk_idx in tqdm(range(total_chunks), desc="Generating Audio", unit="chunk"):
+            slot = chunk_idx % WRITE_BUFFERS
+            stereo_chunk = stereo_chunks[slot]
+            # Wait for the buffer's previous write, re-raising any error it hit
+            if pending_writes[slot] is not None:
+                pending_writes[slot].result()
+            colored_noise = generate_colored_noise(chunk_duration, samplerate, noise_exponent, spectrum)
+            if noise_head is None:
+                noise_head = colored_noise[:len(seam_ramp)].copy()
+            else:
+                noise_head = blend_noise_seam(colored_noise, noise_head, seam_ramp)
+            synth_chunk(stereo_chunk, colored_noise, dphase_left, dphase_right,
+                        chunk_idx * chunk_size, tone_volume, noise_volume, gain)
+            # Only the very start and end of the track need a fade
+            if chunk_idx == 0 or chunk_idx == total_chunks - 1:
+                apply_fade(stereo_chunk, samplerate, fade_time=0.02,
+                           fade_in=chunk_idx == 0, fade_out=chunk_idx == total_chunks - 1)
+            pending_writes[slot] = writer.submit(f.write, stereo_chunk)
+        for write in pending_writes:
+            if write is not None:
+                write.result()
     
     print(f"Exported '{filename}'.")
 
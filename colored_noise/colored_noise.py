@@ -1,99 +1,335 @@
 import numpy as np
-from scipy.io.wavfile import write
+import scipy.fft as sfft
 import os
 import argparse
-from datetime import datetime, precisedelta
+import logging
+import math
+import numba
+from datetime import datetime, timedelta
+import mmap
+import sys
 import time
+from humanize import precisedelta
 
-def generate_colored_noise(alpha, duration_sec=5, sample_rate=44100, apply_alpha_scaling=True):
+try:
+    from wav_writer import HEADER_SIZE as WAV_HEADER_SIZE, wav_header
+except ImportError:
+    if __name__ != '__main__':
+        raise
+    # Run as a script from its own folder, so the shared WAV writer in the repository
+    # root is not importable yet
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from wav_writer import HEADER_SIZE as WAV_HEADER_SIZE, wav_header
+
+logger = logging.getLogger(__name__)
+
+try:
+    from mkl_fft.interfaces import scipy_fft as mkl_scipy_fft
+except ImportError:  # Optional; scipy's own pocketfft is used without it
+    mkl_scipy_fft = None
+
+try:
+    import pyfftw
+    import pyfftw.interfaces.scipy_fft
+except ImportError:  # Optional; scipy's own pocketfft is used without it
+    pyfftw = None
+
+# Backend for the noise FFTs only, set around each call so other scipy.fft users keep theirs
+if mkl_scipy_fft is not None:
+    # Intel MKL's FFT is faster than pocketfft on Intel CPUs
+    FFT_BACKEND = mkl_scipy_fft
+elif pyfftw is not None:
+    # Every noise color has the same length, so keep the FFTW plan alive between them
+    pyfftw.interfaces.cache.enable()
+    pyfftw.interfaces.cache.set_keepalive_time(60)
+    FFT_BACKEND = pyfftw.interfaces.scipy_fft
+else:
+    FFT_BACKEND = 'scipy'
+
+# SIMD-aligned buffers let FFTW use its vectorized code paths
+empty_aligned = pyfftw.empty_aligned if pyfftw is not None else np.empty
+
+# Memory budget for the colors generated together by one batched inverse FFT
+BATCH_BYTES = 1 << 30
+
+@numba.njit(cache=True)
+def splitmix64(x):
+    """Hash a 64-bit counter into 64 well-mixed random bits (SplitMix64)."""
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+# No ninf/nnan: the min/max reductions start from infinity
+@numba.njit(parallel=True, fastmath={'nsz', 'arcp', 'contract', 'afn', 'reassoc'}, cache=True)
+def dither_and_measure(signal, seed, amplitude):
     """
-    Generate colored noise with a given spectral exponent alpha.
-    
+    Add TPDF dither to a signal in place and measure the result, in one parallel pass.
+
+    The dither for each sample comes from hashing the seed with the sample index, so the
+    threads share no generator state and the output does not depend on the thread count.
+
     Parameters:
-        alpha (float): Spectral exponent (0 = white, 1 = pink, 2 = brown)
-        duration_sec (int): Duration in seconds
-        sample_rate (int): Sampling rate in Hz  
+        signal (numpy.ndarray): float32 time-domain noise
+        seed (int): Seed for the dither
+        amplitude (float): Standard deviation of the dither
+
+    Returns:
+        tuple: (sum of squares, minimum, maximum) of the dithered signal
+    """
+    # The difference of two uniforms on [0, 1) has variance 1/6
+    dither_scale = np.float32(amplitude * np.sqrt(6.0) / (1 << 24))
+    sumsq = 0.0
+    lo = np.inf
+    hi = -np.inf
+    for i in numba.prange(signal.size):
+        bits = splitmix64(np.uint64(seed) + np.uint64(i))
+        # Two 24-bit uniforms from the high and low bits of the hash
+        uniform_a = np.float32(bits >> np.uint64(40))
+        uniform_b = np.float32(bits & np.uint64(0xFFFFFF))
+        value = signal[i] + dither_scale * (uniform_a - uniform_b)
+        signal[i] = value
+        sumsq += value * value
+        lo = min(lo, value)
+        hi = max(hi, value)
+    return sumsq, lo, hi
+
+class ColoredNoiseGen:
+    """
+    Generate colored noise of one length and sample rate for any spectral exponent.
+
+    The FFT frequencies and high-pass mask only depend on the length, and the gain curve
+    only on the exponent, so they are computed once and reused for every noise color.
+
+    Usage:
+        gen = ColoredNoiseGen(n_samples=5 * 44100, sample_rate=44100)
+        pink = gen.generate(1.0)
+    """
+
+    def __init__(self, n_samples, sample_rate, rng=None):
+        self.n_samples = n_samples
+        self.sample_rate = sample_rate
+        
+        # PCG64 generator shared by every noise color
+        self.rng = rng if rng is not None else np.random.default_rng()
+        
+        # An empty signal has no rfft bins, which rfftfreq cannot express
+        freqs = sfft.rfftfreq(n_samples, d=1/sample_rate) if n_samples else np.zeros(0)
+        freqs = freqs.astype(np.float32)
+        
+        # Avoid division by zero and limit the scaling for very low frequencies
+        min_freq = 20.0  # 20 Hz minimum
+        self.freqs = np.maximum(freqs, min_freq/sample_rate)
+        
+        # High-pass filter to remove DC and very low frequencies
+        self.highpass = self.freqs > (20.0/sample_rate)  # 20 Hz cutoff
+        
+        # f^x is evaluated as exp(x * log f), so the log is taken once for every exponent
+        self.log_freqs = np.log(self.freqs)
+        
+        self._gain_cache = {}
+
+    def gain(self, effective_alpha):
+        """
+        Get the real per-bin spectrum gain for an effective exponent, computing it on first use.
+
+        The gain combines the power law scaling, zero below the high-pass cutoff, and the
+        white noise variance.
+
+        Returns:
+            numpy.ndarray: Read-only float32 gain per rfft bin.
+        """
+        gain = self._gain_cache.get(effective_alpha)
+        if gain is None:
+            # Base scaling factor
+            base_scale = 1.0
+            gain = np.multiply(self.log_freqs, np.float32(-effective_alpha / 2),
+                               where=self.highpass, out=np.zeros_like(self.freqs))
+            np.exp(gain, out=gain, where=self.highpass)
+            gain *= base_scale * np.sqrt(self.n_samples / 2)
+            gain.flags.writeable = False
+            self._gain_cache[effective_alpha] = gain
+        return gain
+
+    def generate(self, alpha, apply_alpha_scaling=True):
+        """
+        Generate colored noise with a given spectral exponent alpha.
+        
+        Parameters:
+            alpha (float): Spectral exponent (0 = white, 1 = pink, 2 = brown)
+            apply_alpha_scaling (bool): Whether to apply special scaling for alpha > 1
+        
+        Returns:
+          numpy.ndarray: float32 noise normalized to the range -1 to 1.
+        """
+        return self.generate_batch([alpha], apply_alpha_scaling)[0]
+
+    def generate_batch(self, alphas, apply_alpha_scaling=True):
+        """
+        Generate one colored noise signal per spectral exponent with a single batched inverse FFT.
+        
+        Parameters:
+            alphas (list): Spectral exponents (0 = white, 1 = pink, 2 = brown)
+            apply_alpha_scaling (bool): Whether to apply special scaling for alpha > 1
+        
+        Returns:
+          numpy.ndarray: float32 array of shape (len(alphas), n_samples), each row
+            normalized to the range -1 to 1.
+        """
+        n_samples = self.n_samples
+        if n_samples == 0:
+            return np.zeros((len(alphas), 0), dtype=np.float32)
+        
+        # Draw the spectrum of white noise directly. The rfft bins of unit white noise are
+        # complex Gaussian with variance n_samples, so no time-domain noise or forward FFT is needed.
+        n_freqs = n_samples // 2 + 1
+        spectra = empty_aligned((len(alphas), n_freqs), dtype=np.complex64)
+        self.rng.standard_normal(dtype=np.float32, out=spectra.view(np.float32))
+        
+        for alpha, spectrum in zip(alphas, spectra):
+            logger.info(f"\nGenerating noise with α={alpha}")
+            
+            # Gain curve shared by every call with this exponent
+            gain = self.gain(effective_exponent(alpha, apply_alpha_scaling))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Spectrum gain range: {np.min(gain[1:]):.2e} to {np.max(gain):.2e}")
+            
+            # Scale the whole spectrum in a single pass
+            spectrum *= gain
+        
+        # Transform every color back to time domain at once, using every core for long durations
+        with sfft.set_backend(FFT_BACKEND):
+            signals = sfft.irfft(spectra, n=n_samples, axis=1, workers=-1)
+        
+        for alpha, signal in zip(alphas, signals):
+            logger.info(f"\nNormalizing noise with α={alpha}")
+            normalize_noise(signal, self.rng)
+        
+        return signals
+
+    def generate_batches(self, alphas, apply_alpha_scaling=True):
+        """
+        Generate colored noise for every exponent, batching only as many colors as fit in BATCH_BYTES.
+        
+        Parameters:
+            alphas (list): Spectral exponents (0 = white, 1 = pink, 2 = brown)
+            apply_alpha_scaling (bool): Whether to apply special scaling for alpha > 1
+        
+        Yields:
+            tuple: (alpha, signal) with signal as float32 noise normalized to the range -1 to 1.
+        """
+        # Each color holds a complex64 spectrum and a float32 signal, about 8 bytes per sample
+        batch_size = max(1, BATCH_BYTES // (8 * max(self.n_samples, 1)))
+        for start in range(0, len(alphas), batch_size):
+            group = alphas[start:start + batch_size]
+            yield from zip(group, self.generate_batch(group, apply_alpha_scaling))
+
+def effective_exponent(alpha, apply_alpha_scaling=True):
+    """
+    Get the exponent actually used for the power law scaling.
+
+    Parameters:
+        alpha (float): Spectral exponent
         apply_alpha_scaling (bool): Whether to apply special scaling for alpha > 1
-    
+
     Returns:
-      numpy.ndarray: 16-bit PCM formatted noise.
+        float: The effective spectral exponent
     """
-    n_samples = int(duration_sec * sample_rate)
-    
-    # Generate white noise in time domain
-    white = np.random.normal(0, 1, n_samples)
-    
-    # Transform to frequency domain
-    spectrum = np.fft.rfft(white)
-    
-    # Get frequencies for the FFT
-    freqs = np.fft.rfftfreq(n_samples, d=1/sample_rate)
-    
-    # Avoid division by zero and limit the scaling for very low frequencies
-    min_freq = 20.0  # 20 Hz minimum
-    freqs = np.maximum(freqs, min_freq/sample_rate)
-    
-    # Base scaling factor
-    base_scale = 1.0
-    
     # For alpha > 1.0, we can optionally reduce the scaling to prevent too much low-frequency dominance
     if alpha > 1.0 and apply_alpha_scaling:
         # Reduce the effective alpha for higher values to prevent extreme low-frequency dominance
-        effective_alpha = alpha * (1.0 - 0.25 * (alpha - 1.0))
-    else:
-        effective_alpha = alpha
-    
-    # Apply the power law scaling
-    spectrum *= base_scale / (freqs ** (effective_alpha/2))
-    
-    # Add a high-pass filter to remove DC and very low frequencies
-    highpass = freqs > (20.0/sample_rate)  # 20 Hz cutoff
-    spectrum *= highpass
-    
-    # Debug print for spectrum values
-    print(f"Spectrum magnitude range: {np.min(np.abs(spectrum[1:])):.2e} to {np.max(np.abs(spectrum[1:])):.2e}")
-    
-    # Transform back to time domain
-    signal = np.fft.irfft(spectrum, n=n_samples)
-    
-    # Debug print for signal before normalization
-    print(f"Signal range before normalization: {np.min(signal):.2e} to {np.max(signal):.2e}")
+        return alpha * (1.0 - 0.25 * (alpha - 1.0))
+    return alpha
+
+def normalize_noise(signal, rng):
+    """
+    Dither a noise signal and normalize it to the target RMS without clipping, in place.
+
+    The dither, RMS and peak all come from one fused pass, and the final scale is applied
+    in a second, so the signal is streamed twice rather than once per step.
+
+    Parameters:
+        signal (numpy.ndarray): float32 time-domain noise
+        rng (numpy.random.Generator): Generator for the dither seed
+    """
+    # An empty signal has no RMS to normalize
+    if signal.size == 0:
+        return
     
     # Add a small amount of white noise to ensure there's always some variation
-    signal += np.random.normal(0, 0.001, n_samples)
+    sumsq, lo, hi = dither_and_measure(signal, rng.integers(2**63), 0.001)
+    
+    # Debug output for signal before normalization
+    logger.debug(f"Signal range before normalization: {lo:.2e} to {hi:.2e}")
     
     # Normalize RMS (Root Mean Square) to a target value
     target_rms = 0.1  # Adjust this value to control overall volume
-    current_rms = np.sqrt(np.mean(signal**2))
-    print(f"Current RMS before normalization: {current_rms:.2e}")
+    current_rms = math.sqrt(sumsq / signal.size)
+    logger.debug(f"Current RMS before normalization: {current_rms:.2e}")
     
-    if current_rms > 0:
-        signal *= (target_rms / current_rms)
+    scale = target_rms / current_rms if current_rms > 0 else 1.0
     
     # Ensure no clipping
-    max_val = np.max(np.abs(signal))
-    if max_val > 1.0:
-        signal /= max_val
+    peak = max(-lo, hi) * scale
+    if peak > 1.0:
+        scale /= peak
+    signal *= scale
     
-    # Debug print for final signal
-    print(f"Final signal range: {np.min(signal):.2e} to {np.max(signal):.2e}")
-    print(f"Final RMS: {np.sqrt(np.mean(signal**2)):.2e}")
+    # Debug output for final signal, derived from the measurements rather than another pass
+    logger.debug(f"Final signal range: {lo * scale:.2e} to {hi * scale:.2e}")
+    logger.debug(f"Final RMS: {current_rms * scale:.2e}")
+
+def generate_colored_noise(alpha, duration_sec=5, sample_rate=44100, apply_alpha_scaling=True):
+    """
+    Generate colored noise with a given spectral exponent alpha.
+
+    For several colors of the same length, reuse one ColoredNoiseGen instead.
     
-    return signal
+    Parameters:
+        alpha (float): Spectral exponent (0 = white, 1 = pink, 2 = brown)
+        duration_sec (int): Duration in seconds
+        sample_rate (int): Sampling rate in Hz  
+        apply_alpha_scaling (bool): Whether to apply special scaling for alpha > 1
+    
+    Returns:
+      numpy.ndarray: float32 noise normalized to the range -1 to 1.
+    """
+    gen = ColoredNoiseGen(int(duration_sec * sample_rate), sample_rate)
+    return gen.generate(alpha, apply_alpha_scaling)
 
 def save_wav(signal, filename, sample_rate=44100):
     """
     Scale the normalized signal to 16-bit PCM format and writes it to a WAV file.
+
+    The file is sized up front and memory-mapped, so the samples are quantized straight
+    into the page cache with no int16 array or bytes copy in between.
     
     Parameters:
         signal (numpy.ndarray): Normalized signal array with values between -1 and 1
         filename (str): Output filename for the WAV file
         sample_rate (int): Sampling rate in Hz (default: 44100)
     """
-    scaled = np.int16(signal * 32767)
-    # Debug print for scaled values
-    print(f"Scaled int16 range: {np.min(scaled)} to {np.max(scaled)}")
-    write(filename, sample_rate, scaled)
+    with open(filename, 'w+b') as f:
+        f.write(wav_header(2 * len(signal), sample_rate, channels=1))
+        f.truncate(WAV_HEADER_SIZE + 2 * len(signal))
+        if len(signal) == 0:
+            return
+        with mmap.mmap(f.fileno(), 0) as mm:
+            pcm = np.frombuffer(mm, dtype='<i2', count=len(signal), offset=WAV_HEADER_SIZE)
+            try:
+                np.multiply(signal, 32767, out=pcm, casting='unsafe')
+                # Debug output for scaled values, which costs two extra passes
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"Scaled int16 range: {np.min(pcm)} to {np.max(pcm)}")
+            finally:
+                # The map cannot close while an array still exports its buffer, and the
+                # BufferError from trying would hide any error raised above
+                del pcm
+
+def configure_logging(verbose):
+    """Set up console logging, with signal statistics only when verbose."""
+    logging.basicConfig(format='%(message)s', level=logging.INFO)
+    logger.setLevel(logging.DEBUG if verbose else logging.INFO)
 
 if __name__ == '__main__':
     # Common noise colors for reference
@@ -115,8 +351,10 @@ if __name__ == '__main__':
                        help='Disable special scaling for alpha > 1 (use true exponent values)')
     parser.add_argument('-e', '--exponents', nargs='+', type=float, 
                        help='Exponent values to generate (default: all common colors)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Print signal statistics for each file')
     
     args = parser.parse_args()
+    configure_logging(args.verbose)
     
     # Create output directory if it doesn't exist
     os.makedirs(args.output_dir, exist_ok=True)
@@ -127,16 +365,15 @@ if __name__ == '__main__':
     start_time = time.time()
     print(f"Started at {datetime.fromtimestamp(start_time).strftime('%Y-%m-%d %H:%M:%S')}")
     
-    for alpha in exponents_to_generate:
-        print(f"\nGenerating noise with α={alpha}")
+    # Every color has the same length, so they are generated with batched FFTs that fit in memory
+    alphas = list(exponents_to_generate)
+    gen = ColoredNoiseGen(int(args.duration * args.sample_rate), args.sample_rate)
+    for alpha, signal in gen.generate_batches(alphas, apply_alpha_scaling=not args.no_alpha_scaling):
         filename = os.path.join(args.output_dir, f"colored_noise_alpha_{alpha}.wav")
-        noise = generate_colored_noise(alpha, duration_sec=args.duration, 
-                                     sample_rate=args.sample_rate, 
-                                     apply_alpha_scaling=not args.no_alpha_scaling)
-        save_wav(noise, filename, sample_rate=args.sample_rate)
+        save_wav(signal, filename, sample_rate=args.sample_rate)
     
     end_time = time.time()
     print(f"\nCompleted at {datetime.fromtimestamp(end_time).strftime('%Y-%m-%d %H:%M:%S')}")
-    duration = precisedelta(seconds=end_time - start_time)
+    duration = precisedelta(timedelta(seconds=end_time - start_time), minimum_unit="seconds")
     print(f"Time taken: {duration}")
     print("Done!")
\ No newline at end of file
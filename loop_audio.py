@@ -1,46 +1,143 @@
 import argparse
 import os
+import struct
 import time
+import wave
 from datetime import datetime, timedelta
 import numpy as np
 import soundfile as sf
 from tqdm import tqdm
 from humanize import naturalsize, precisedelta
+from wav_writer import RawWavAppender
 
-def calculate_audio_duration(audio_data, sample_rate):
-    return len(audio_data) / sample_rate
+WRITE_BLOCK_BYTES = 16 << 20  # Target size of the block of repeats written per call
+
+def read_pcm16(input_file):
+    """
+    Read a clip as 16-bit PCM samples.
+
+    16-bit PCM WAV files are read with the wave module, which hands back the data chunk
+    as-is with no decoding. Anything else is decoded and converted by soundfile.
+    libsndfile does not scale floating-point files read as integers, so those are read
+    as float and quantized here.
+
+    Returns:
+        tuple: (audio_data, sample_rate) with int16 audio_data of shape (frames, channels).
+    """
+    try:
+        with wave.open(input_file, 'rb') as wav:
+            if wav.getsampwidth() == 2:
+                frames = wav.readframes(wav.getnframes())
+                # A WAV streamed to a pipe has no real data size, so the read runs to the
+                # end of the file and can stop partway through a frame
+                frame_size = 2 * wav.getnchannels()
+                frames = memoryview(frames)[:len(frames) - len(frames) % frame_size]
+                audio_data = np.frombuffer(frames, dtype='<i2').reshape(-1, wav.getnchannels())
+                return audio_data, wav.getframerate()
+    except (wave.Error, EOFError):
+        pass  # Not a PCM WAV file
+    if sf.info(input_file).subtype not in ('FLOAT', 'DOUBLE'):
+        return sf.read(input_file, dtype='int16', always_2d=True)
+    audio_data, sample_rate = sf.read(input_file, dtype='float32', always_2d=True)
+    np.clip(audio_data, -1, 1, out=audio_data)
+    return np.rint(audio_data * 32767).astype(np.int16), sample_rate
+
+def find_pcm16_data(input_file):
+    """
+    Locate the sample data of a 16-bit PCM WAV file by walking its RIFF chunks.
+
+    The size is clamped to the bytes actually in the file and rounded down to whole
+    frames, since WAVs streamed to a pipe leave the data size unset (0xFFFFFFFF) or wrong.
+
+    Returns:
+        tuple or None: (offset, size, sample_rate, channels) of the data chunk, or None
+            if the file is not 16-bit PCM WAV.
+    """
+    with open(input_file, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        riff, _, form = struct.unpack('<4sI4s', f.read(12).ljust(12, b'\0'))
+        if riff != b'RIFF' or form != b'WAVE':
+            return None
+        fmt = None
+        while len(header := f.read(8)) == 8:
+            chunk_id, chunk_size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ' and chunk_size >= 16:
+                fmt = struct.unpack('<HHIIHH', f.read(16))
+                chunk_size -= 16
+            elif chunk_id == b'data':
+                if fmt is None:
+                    return None
+                format_tag, channels, sample_rate, _, _, bits = fmt
+                # 0xFFFE is WAVE_FORMAT_EXTENSIBLE, which is PCM whenever the bit depth is 16
+                if format_tag not in (1, 0xFFFE) or bits != 16:
+                    return None
+                offset = f.tell()
+                size = min(chunk_size, file_size - offset)
+                return offset, size - size % (channels * 2), sample_rate, channels
+            # Chunks are padded to an even size
+            f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+    return None
+
+def calculate_audio_duration(num_frames, sample_rate):
+    return num_frames / sample_rate
 
 def calculate_required_loops(input_duration, target_duration_minutes):
     target_duration_seconds = target_duration_minutes * 60
     num_repeats = int(np.ceil(target_duration_seconds / input_duration))
     return num_repeats
 
+def append_repeats(wav, audio_data, num_repeats, progress):
+    """Append num_repeats copies of audio_data, written in blocks of repeats."""
+    # Tile the clip once into a block of several repeats so long outputs take few, large writes
+    repeats_per_block = max(1, min(num_repeats, WRITE_BLOCK_BYTES // max(1, audio_data.nbytes)))
+    block = np.empty((repeats_per_block * len(audio_data), audio_data.shape[1]), dtype=audio_data.dtype)
+    block.reshape((repeats_per_block,) + audio_data.shape)[:] = audio_data
+    
+    full_blocks, remainder = divmod(num_repeats, repeats_per_block)
+    for _ in range(full_blocks):
+        wav.append(block)
+        progress.update(repeats_per_block)
+    if remainder:
+        wav.append(block[:remainder * len(audio_data)])
+        progress.update(remainder)
+
 def generate_audio(input_file, output_file, target_duration_minutes):    
-    audio_data, sample_rate = sf.read(input_file)
-    input_duration = calculate_audio_duration(audio_data, sample_rate)
+    # 16-bit PCM WAV input is copied into the output by the kernel without being read
+    data_chunk = find_pcm16_data(input_file) if hasattr(os, 'copy_file_range') else None
+    if data_chunk is not None:
+        data_offset, data_size, sample_rate, channels = data_chunk
+        num_frames = data_size // (channels * 2)
+    else:
+        # Only the header is needed to plan the loop; the samples are read right before writing
+        info = sf.info(input_file)
+        sample_rate, channels, num_frames = info.samplerate, info.channels, info.frames
+    input_duration = calculate_audio_duration(num_frames, sample_rate)
     num_repeats = calculate_required_loops(input_duration, target_duration_minutes)
     
+    # Output past the 4 GiB a plain WAV header can describe is written as RF64
+    output_size = num_repeats * num_frames * channels * 2
+    rf64 = output_size > RawWavAppender.MAX_DATA_SIZE
+    
     print(f"Length of sample file: {input_duration:.2f} seconds")
     print(f"Number of repeats needed: {num_repeats}")
+    if rf64:
+        print("Output is over 4 GiB, writing RF64")
     
-    with sf.SoundFile(output_file, 'w', samplerate=sample_rate, channels=audio_data.shape[1], format='WAV') as f:
-
-        chunk_size = 100
-        total_chunks = (num_repeats + chunk_size - 1) // chunk_size
-        
-        for chunk_idx in tqdm(range(total_chunks), desc="Creating long binaural beat", unit="chunk"):
-            start_repeat = chunk_idx * chunk_size
-            end_repeat = min(start_repeat + chunk_size, num_repeats)
-            repeats_in_chunk = end_repeat - start_repeat
-            
-            if repeats_in_chunk > 0:
-                chunk = np.tile(audio_data, (repeats_in_chunk, 1))
-                f.write(chunk)
+    # The clip is 16-bit PCM, so every repeat is the same raw bytes
+    with RawWavAppender(output_file, sample_rate, channels=channels, rf64=rf64) as wav, \
+            tqdm(total=num_repeats, desc="Creating long binaural beat", unit="repeat") as progress:
+        if data_chunk is not None:
+            with open(input_file, 'rb') as source:
+                for _ in range(num_repeats):
+                    wav.append_from(source.fileno(), data_offset, data_size)
+                    progress.update()
+        else:
+            audio_data, _ = read_pcm16(input_file)
+            append_repeats(wav, audio_data, num_repeats, progress)
     
     actual_duration = num_repeats * input_duration
     print(f"Final duration: {actual_duration:.2f} seconds")
 
-
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Create a longer version of a binaural beat audio file.')
     parser.add_argument('-i', '--input', type=str, required=True, help='Path to the input audio clip to loop.')
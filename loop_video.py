@@ -2,17 +2,34 @@ import argparse
 import os
 import time
 import sys
+import tempfile
 from datetime import datetime, timedelta
 import ffmpeg
 import soundfile as sf
 from humanize import naturalsize, precisedelta
 from progress_tracker import show_progress
 
+AAC_FRAME_SIZE = 1024  # Samples per channel in one AAC packet
+
 def get_audio_file_duration(audio_file):
     with sf.SoundFile(audio_file) as audio:
         duration = len(audio) / audio.samplerate
         print(f"Detected audio duration: {duration:.2f} seconds")
         return duration
+
+def get_audio_file_frames(audio_file):
+    with sf.SoundFile(audio_file) as audio:
+        return len(audio)
+
+def can_stream_copy_loops(num_frames):
+    """
+    Check whether a clip's loops can be stream-copied from one AAC encode.
+
+    Stream copy can only cut on packet boundaries, so each loop is exactly the clip's
+    length only when the clip is a whole number of AAC frames long. Any other clip would
+    repeat or drop part of a frame at every seam.
+    """
+    return num_frames > 0 and num_frames % AAC_FRAME_SIZE == 0
     
 def calculate_required_loops(target_duration, audio_duration, crossfade_duration=0): 
     if crossfade_duration > 0:
@@ -20,56 +37,86 @@ def calculate_required_loops(target_duration, audio_duration, crossfade_duration
         effective_duration = audio_duration - crossfade_duration
         audio_loop_count = int(target_duration // effective_duration) - 1
     else:
-        audio_loop_count = target_duration // audio_duration - 1
+        audio_loop_count = int(target_duration // audio_duration) - 1
     
     if audio_loop_count < 0:
         audio_loop_count = 0
     return audio_loop_count
 
+def encode_audio_clip(input, output):
+    """Encode three back-to-back copies of the clip to AAC once, so its loops can be stream-copied."""
+    # The middle copy has no encoder priming or padding, so it is the one that gets repeated
+    ffmpeg.input(input, stream_loop=2).output(output, acodec='aac', audio_bitrate='192k').run(
+        overwrite_output=True, capture_stdout=True, capture_stderr=True)
+
+def write_concat_list(clip, clip_duration, count, list_file):
+    """Write an ffmpeg concat demuxer list that plays the middle copy of the encoded clip `count` times."""
+    entry = "file '{}'\ninpoint {}\noutpoint {}\n".format(
+        os.path.abspath(clip).replace("'", "'\\''"), clip_duration, 2 * clip_duration)
+    with open(list_file, 'w') as f:
+        f.write(entry * int(count))
+
+def render_black_clip(output, resolution):
+    """Encode one second of black video, to be looped with stream copy for the full length."""
+    # Motion search on identical frames is wasted work. Each loop starts with the clip's
+    # only keyframe, and every other frame is an empty P-frame.
+    ffmpeg.input('color=c=black:s={}:d=1'.format(resolution), f='lavfi').output(
+        output, vcodec='libx264', preset='ultrafast', tune='stillimage', crf='28', pix_fmt='yuv420p',
+        **{'x264-params': 'keyint=600:scenecut=0:ref=1:bframes=0'}
+    ).run(overwrite_output=True, capture_stdout=True, capture_stderr=True)
+
 def generate_video(input, output, target_duration_seconds, crossfade_duration=0, resolution='1920x1080'):
     clip_duration = get_audio_file_duration(input)
     audio_loop_count = calculate_required_loops(target_duration_seconds, clip_duration, crossfade_duration)
     print(f"Generating {target_duration_seconds}s video by looping a {clip_duration}s clip {audio_loop_count} times.")
     
-    # Create a black video stream
-    video_stream = ffmpeg.input(
-        'color=c=black:s={}:d={}'.format(resolution, target_duration_seconds),
-        f='lavfi'
-    )
-    
-    if crossfade_duration > 0:
-        # Create the audio stream with crossfading
-        # First create the base stream
-        base_stream = ffmpeg.input(input)
-        
-        # Create the looped stream with crossfade
-        looped_stream = ffmpeg.input(input, stream_loop=audio_loop_count)
-        
-        # Apply crossfade between the base and looped streams
-        audio_stream = ffmpeg.filter([base_stream, looped_stream], 'acrossfade', d=crossfade_duration)
-    else:
-        # Create the audio stream with simple looping
-        audio_stream = ffmpeg.input(input, stream_loop=audio_loop_count)
-    
-    # Combine and output
-    stream = ffmpeg.output(
-        video_stream,
-        audio_stream,
-        output,
-        vcodec='libx264',
-        crf='18',
-        preset='veryslow',
-        pix_fmt='yuv420p',
-        acodec='aac',
-        audio_bitrate='192k'
-    )
-    
-    try:
-        with show_progress(target_duration_seconds) as socket_filename:
-            stream.global_args('-progress', 'unix://{}'.format(socket_filename)).run(capture_stdout=True, capture_stderr=True)
-    except ffmpeg.Error as e:
-        print(e.stderr, file=sys.stderr)
-        sys.exit(1)
+    with tempfile.TemporaryDirectory() as work_dir:
+        try:
+            # Every frame is identical, so encode one second of black and loop its packets
+            black_clip = os.path.join(work_dir, 'black.mp4')
+            render_black_clip(black_clip, resolution)
+            video_stream = ffmpeg.input(black_clip, stream_loop=max(0, int(target_duration_seconds) - 1))
+            
+            if crossfade_duration > 0:
+                # Create the audio stream with crossfading
+                # First create the base stream
+                base_stream = ffmpeg.input(input)
+                
+                # Create the looped stream with crossfade
+                looped_stream = ffmpeg.input(input, stream_loop=audio_loop_count)
+                
+                # Apply crossfade between the base and looped streams
+                audio_stream = ffmpeg.filter([base_stream, looped_stream], 'acrossfade', d=crossfade_duration)
+                audio_opts = {'acodec': 'aac', 'audio_bitrate': '192k'}
+            elif not can_stream_copy_loops(get_audio_file_frames(input)):
+                # Loops must be sample-exact, so re-encode the looped clip as one stream
+                audio_stream = ffmpeg.input(input, stream_loop=audio_loop_count)
+                audio_opts = {'acodec': 'aac', 'audio_bitrate': '192k'}
+            else:
+                # The clip is whole AAC frames long, so encode it once and let the concat
+                # demuxer repeat its packets
+                clip = os.path.join(work_dir, 'clip.m4a')
+                concat_list = os.path.join(work_dir, 'concat.txt')
+                encode_audio_clip(input, clip)
+                write_concat_list(clip, clip_duration, audio_loop_count + 1, concat_list)
+                audio_stream = ffmpeg.input(concat_list, f='concat', safe=0)
+                audio_opts = {'acodec': 'copy'}
+            
+            # Combine and output
+            stream = ffmpeg.output(
+                video_stream,
+                audio_stream,
+                output,
+                vcodec='copy',
+                t=target_duration_seconds,
+                **audio_opts
+            )
+            
+            with show_progress(target_duration_seconds) as socket_filename:
+                stream.global_args('-progress', 'unix://{}'.format(socket_filename)).run(capture_stdout=True, capture_stderr=True)
+        except ffmpeg.Error as e:
+            print(e.stderr, file=sys.stderr)
+            sys.exit(1)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Generate a black screen video with looped audio.')
@@ -0,0 +1,19 @@
+import numba
+
+@numba.njit(fastmath=True, cache=True)
+def absmax(signal):
+    """
+    Find the peak absolute value of a signal in a single pass, without an |x| temporary.
+
+    Parameters:
+        signal (numpy.ndarray): Input signal of any shape.
+
+    Returns:
+        float: The largest absolute sample value.
+    """
+    peak = 0.0
+    for value in signal.ravel():
+        magnitude = abs(value)
+        if magnitude > peak:
+            peak = magnitude
+    return peak
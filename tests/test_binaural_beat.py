@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('numba')
+pytest.importorskip('scipy')
+from binaural_beat.binaural_beat import quantize_int16
+
+
+def test_quantize_matches_the_float_reference():
+    rng = np.random.default_rng(0)
+    # Include samples that clip once the gain is applied
+    signal = rng.uniform(-1.5, 1.5, size=(10000, 2)).astype(np.float32)
+    gains = np.array([0.9, 0.4])
+
+    scaled = quantize_int16(signal, gains)
+
+    expected = np.clip(np.rint(signal * gains * 32767), -32768, 32767)
+    assert scaled.dtype == np.int16
+    assert np.abs(scaled - expected).max() <= 1
+    assert scaled.max() == 32767 and scaled.min() == -32768
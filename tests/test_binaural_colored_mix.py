@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+sf = pytest.importorskip('soundfile')
+pytest.importorskip('numba')
+pytest.importorskip('tqdm')
+import binaural_colored_mix as mix
+
+
+@pytest.mark.parametrize('start', [0, 44100 * 3600 * 12, 2**40 + 12345])
+def test_lut_sine_matches_np_sin_after_the_phase_wraps(start):
+    dphase = mix.phase_increment(440.0, 44100)
+    out = np.empty(4096, dtype=np.float32)
+    mix.lut_sine(out, start, dphase)
+
+    phase = np.array([(i * int(dphase)) % 2**32 for i in range(start, start + len(out))], dtype=np.float64)
+    np.testing.assert_allclose(out, np.sin(2 * np.pi * phase / 2**32), rtol=0, atol=2e-6)
+
+
+def test_mix_saturates_to_the_int16_range():
+    left = np.array([1.0, -1.0, 0.5, 0.0], dtype=np.float32)
+    right = -left
+    noise = np.array([0.5, -0.5, 0.0, 0.25], dtype=np.float32)
+    out = np.empty(2 * len(left), dtype=np.int16)
+    mix.mix_to_i16(out, left, right, noise, np.float32(32767), np.float32(32767))
+
+    expected = np.clip(np.rint(32767 * (np.stack([left, right], axis=1) + noise[:, None])), -32768, 32767)
+    np.testing.assert_array_equal(out.reshape(-1, 2), expected)
+    assert out.max() == 32767 and out.min() == -32768
+
+
+def test_noise_seam_crossfades_from_the_previous_head():
+    rng = np.random.default_rng(0)
+    noise = rng.standard_normal(100).astype(np.float32)
+    original = noise.copy()
+    previous_head = rng.standard_normal(10).astype(np.float32)
+    ramp = np.linspace(0, 1, 10, dtype=np.float32)
+
+    new_head = mix.blend_noise_seam(noise, previous_head, ramp)
+
+    np.testing.assert_array_equal(new_head, original[:10])
+    np.testing.assert_allclose(noise[:10], previous_head + ramp * (original[:10] - previous_head), atol=1e-6)
+    assert noise[0] == previous_head[0] and noise[9] == original[9]
+    np.testing.assert_array_equal(noise[10:], original[10:])
+
+
+@pytest.mark.parametrize('fade_in, fade_out', [(True, False), (False, True), (True, True)])
+def test_int16_fade_matches_the_float_fade(fade_in, fade_out):
+    samplerate = 8000
+    rng = np.random.default_rng(1)
+    signal = rng.integers(-32768, 32768, size=(samplerate // 10, 2)).astype(np.int16)
+
+    expected = mix.apply_fade(signal.astype(np.float64), samplerate, fade_in=fade_in, fade_out=fade_out)
+    faded = mix.apply_fade(signal.copy(), samplerate, fade_in=fade_in, fade_out=fade_out)
+
+    assert faded.dtype == np.int16
+    assert np.abs(faded - expected).max() <= 1
+
+
+def test_chunked_mix_length_and_tone(tmp_path):
+    samplerate = 8000
+    base_freq = 200
+    path = tmp_path / 'mix.wav'
+    mix.generate_layered_binaural_noise_chunked(
+        base_freq=base_freq, beat_freq=4, tone_volume=0.5, noise_exponent=1.0, noise_volume=0,
+        duration=3, samplerate=samplerate, chunk_duration=1, filename=str(path))
+
+    data, read_samplerate = sf.read(str(path), dtype='int16')
+    assert read_samplerate == samplerate
+    assert data.shape == (3 * samplerate, 2)
+
+    # With no noise the gain puts the tones at full scale; skip the fades at either end
+    t = np.arange(len(data)) / samplerate
+    expected = 32767 * np.sin(2 * np.pi * np.array([base_freq, base_freq + 4]) * t[:, None])
+    fade = int(samplerate * 0.02)
+    assert np.abs(data[fade:-fade] - expected[fade:-fade]).max() <= 2
@@ -0,0 +1,63 @@
+import sys
+
+import numpy as np
+import pytest
+
+sf = pytest.importorskip('soundfile')
+pytest.importorskip('numba')
+pytest.importorskip('humanize')
+
+
+def test_import_leaves_sys_path_alone():
+    path = list(sys.path)
+    sys.modules.pop('colored_noise.colored_noise', None)
+    import colored_noise.colored_noise  # noqa: F401
+    assert sys.path == path
+
+
+def test_save_wav_writes_16_bit_pcm(tmp_path):
+    from colored_noise.colored_noise import save_wav
+    signal = np.linspace(-1, 1, 1001, dtype=np.float32)
+    path = tmp_path / 'noise.wav'
+    save_wav(signal, str(path), sample_rate=22050)
+
+    data, samplerate = sf.read(str(path), dtype='int16')
+    assert samplerate == 22050
+    np.testing.assert_array_equal(data, (signal * 32767).astype(np.int16))
+
+
+def test_save_wav_keeps_the_original_error(tmp_path, monkeypatch):
+    from colored_noise import colored_noise
+
+    def fail(level):
+        raise RuntimeError('boom')
+
+    # Fail while the int16 view of the map is still alive
+    monkeypatch.setattr(colored_noise.logger, 'isEnabledFor', fail)
+    with pytest.raises(RuntimeError, match='boom'):
+        colored_noise.save_wav(np.zeros(10, dtype=np.float32), str(tmp_path / 'noise.wav'))
+
+
+def test_dither_and_measure_matches_numpy():
+    from colored_noise.colored_noise import dither_and_measure
+    rng = np.random.default_rng(0)
+    original = rng.uniform(-0.5, 0.5, 1 << 20).astype(np.float32)
+    amplitude = 1e-3
+
+    signal = original.copy()
+    sumsq, lo, hi = dither_and_measure(signal, 1234, amplitude)
+
+    np.testing.assert_allclose(sumsq, np.dot(signal.astype(np.float64), signal), rtol=1e-5)
+    assert (lo, hi) == (signal.min(), signal.max())
+    assert np.std(signal.astype(np.float64) - original) == pytest.approx(amplitude, rel=0.02)
+
+    # The dither only depends on the seed
+    again = original.copy()
+    again_sumsq, again_lo, again_hi = dither_and_measure(again, 1234, amplitude)
+    np.testing.assert_array_equal(again, signal)
+    assert (again_lo, again_hi) == (lo, hi)
+    # The parallel sum may add in a different order
+    assert again_sumsq == pytest.approx(sumsq, rel=1e-9)
+    other = original.copy()
+    dither_and_measure(other, 1235, amplitude)
+    assert not np.array_equal(other, signal)
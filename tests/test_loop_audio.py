@@ -0,0 +1,125 @@
+import os
+import struct
+
+import numpy as np
+import pytest
+
+sf = pytest.importorskip('soundfile')
+pytest.importorskip('tqdm')
+pytest.importorskip('humanize')
+import loop_audio
+from wav_writer import RawWavAppender
+
+
+def write_clip(path, num_frames=4410, samplerate=44100):
+    data = (np.arange(2 * num_frames) % 2000 - 1000).astype(np.int16).reshape(-1, 2)
+    sf.write(str(path), data, samplerate, subtype='PCM_16')
+    return data
+
+
+def test_output_past_the_wav_limit_is_written_as_rf64(tmp_path, monkeypatch):
+    clip = write_clip(tmp_path / 'clip.wav')
+    # Pretend the 4 GiB limit is a few repeats long
+    monkeypatch.setattr(RawWavAppender, 'MAX_DATA_SIZE', 3 * clip.nbytes)
+    output = tmp_path / 'out.wav'
+    loop_audio.generate_audio(str(tmp_path / 'clip.wav'), str(output), 0.05)
+
+    with sf.SoundFile(str(output)) as f:
+        assert f.format == 'RF64'
+        np.testing.assert_array_equal(f.read(dtype='int16'), np.tile(clip, (30, 1)))
+
+
+def streamed_wav(data, samplerate=44100, trailing=b''):
+    """Build a WAV the way ffmpeg writes one to a pipe: unset sizes and a LIST chunk first."""
+    channels = data.shape[1]
+    info = b'INFOISFT\x0e\x00\x00\x00Lavf61.1.100\x00\x00'
+    return (struct.pack('<4sI4s', b'RIFF', 0xFFFFFFFF, b'WAVE')
+            + struct.pack('<4sIHHIIHH', b'fmt ', 16, 1, channels, samplerate,
+                          samplerate * channels * 2, channels * 2, 16)
+            + struct.pack('<4sI', b'LIST', len(info)) + info
+            + struct.pack('<4sI', b'data', 0xFFFFFFFF) + data.tobytes() + trailing)
+
+
+def test_streamed_data_size_is_clamped_to_whole_frames(tmp_path):
+    data = write_clip(tmp_path / 'unused.wav')
+    path = tmp_path / 'streamed.wav'
+    # A stray byte after the samples must not become part of a frame
+    path.write_bytes(streamed_wav(data, trailing=b'\x01'))
+
+    offset, size, sample_rate, channels = loop_audio.find_pcm16_data(str(path))
+    assert (size, sample_rate, channels) == (data.nbytes, 44100, 2)
+    assert path.read_bytes()[offset:offset + size] == data.tobytes()
+
+
+@pytest.mark.parametrize('kernel_copy', [
+    pytest.param(True, marks=pytest.mark.skipif(not hasattr(os, 'copy_file_range'),
+                                                reason='needs os.copy_file_range')),
+    False,
+])
+def test_streamed_clip_loops_at_its_real_length(tmp_path, monkeypatch, kernel_copy):
+    if not kernel_copy:
+        # Without copy_file_range the clip is read with read_pcm16 instead
+        monkeypatch.delattr(os, 'copy_file_range', raising=False)
+    data = write_clip(tmp_path / 'unused.wav')
+    path = tmp_path / 'streamed.wav'
+    path.write_bytes(streamed_wav(data, trailing=b'\x01'))
+    output = tmp_path / 'out.wav'
+    loop_audio.generate_audio(str(path), str(output), 0.05)
+
+    read, _ = sf.read(str(output), dtype='int16')
+    np.testing.assert_array_equal(read, np.tile(data, (30, 1)))
+
+
+def build_wav(data, fmt_chunk, extra_chunks=b''):
+    body = b'WAVE' + fmt_chunk + extra_chunks + struct.pack('<4sI', b'data', data.nbytes) + data.tobytes()
+    return struct.pack('<4sI', b'RIFF', len(body)) + body
+
+
+def pcm_fmt(channels, samplerate=44100, bits=16, format_tag=1, extension=b''):
+    block_align = channels * bits // 8
+    body = struct.pack('<HHIIHH', format_tag, channels, samplerate,
+                       samplerate * block_align, block_align, bits) + extension
+    return struct.pack('<4sI', b'fmt ', len(body)) + body
+
+
+def extensible_fmt(channels, subformat=1):
+    # cbSize, valid bits, channel mask and the subformat GUID
+    extension = struct.pack('<HHI', 22, 16, 0) + struct.pack('<I', subformat) + \
+        b'\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71'
+    return pcm_fmt(channels, format_tag=0xFFFE, extension=extension)
+
+
+ODD_CHUNK = struct.pack('<4sI', b'junk', 3) + b'abc\x00'  # Padded to an even size
+
+
+@pytest.mark.parametrize('fmt_chunk, extra_chunks', [
+    (pcm_fmt(2), b''),
+    (pcm_fmt(2, extension=struct.pack('<H', 0)), ODD_CHUNK),  # 18-byte fmt with cbSize
+    (extensible_fmt(2), ODD_CHUNK),
+])
+def test_pcm16_data_is_found_past_other_chunks(tmp_path, fmt_chunk, extra_chunks):
+    data = write_clip(tmp_path / 'unused.wav', num_frames=101)
+    path = tmp_path / 'clip.wav'
+    path.write_bytes(build_wav(data, fmt_chunk, extra_chunks))
+
+    offset, size, sample_rate, channels = loop_audio.find_pcm16_data(str(path))
+    assert (size, sample_rate, channels) == (data.nbytes, 44100, 2)
+    assert path.read_bytes()[offset:offset + size] == data.tobytes()
+
+    audio_data, sample_rate = loop_audio.read_pcm16(str(path))
+    assert sample_rate == 44100
+    np.testing.assert_array_equal(audio_data, data)
+
+
+def test_non_pcm16_wavs_are_left_to_soundfile(tmp_path):
+    path = tmp_path / 'float.wav'
+    data = np.linspace(-0.5, 0.5, 200, dtype=np.float32).reshape(-1, 2)
+    sf.write(str(path), data, 44100, subtype='FLOAT')
+    assert loop_audio.find_pcm16_data(str(path)) is None
+
+    audio_data, sample_rate = loop_audio.read_pcm16(str(path))
+    assert audio_data.dtype == np.int16 and sample_rate == 44100
+    np.testing.assert_array_equal(audio_data, np.rint(data * 32767))
+
+    path.write_bytes(build_wav(data.view(np.int32), pcm_fmt(2, bits=32)))
+    assert loop_audio.find_pcm16_data(str(path)) is None
@@ -0,0 +1,82 @@
+import pathlib
+import shutil
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+pytest.importorskip('ffmpeg')
+gevent = pytest.importorskip('gevent')
+import ffmpeg
+import gevent.monkey
+
+
+@pytest.fixture(scope='module')
+def loop_video():
+    # loop_video monkey-patches the whole interpreter for gevent on import, and a fork
+    # through the patched subprocess can deadlock the Numba thread pool the other tests
+    # started, so the helpers are imported here with the patching switched off
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(gevent.monkey, 'patch_all', lambda **kwargs: None)
+        import loop_video
+    return loop_video
+
+
+def test_loop_count_is_an_integer_for_fractional_clip_durations(loop_video):
+    count = loop_video.calculate_required_loops(3600, 12.5)
+    assert count == 287
+    assert isinstance(count, int)
+
+
+def test_concat_list_repeats_the_trimmed_clip(tmp_path, loop_video):
+    clip = tmp_path / "clip.m4a"
+    list_file = tmp_path / "concat.txt"
+    clip_duration = 12.5
+    count = loop_video.calculate_required_loops(60, clip_duration) + 1
+    loop_video.write_concat_list(str(clip), clip_duration, count, str(list_file))
+
+    lines = list_file.read_text().splitlines()
+    assert len(lines) == 3 * count
+    assert lines[:3] == ["file '{}'".format(clip), "inpoint 12.5", "outpoint 25.0"]
+
+
+def test_only_whole_aac_frame_clips_are_stream_copied(loop_video):
+    assert loop_video.can_stream_copy_loops(128 * 1024)
+    assert not loop_video.can_stream_copy_loops(220500)
+    assert not loop_video.can_stream_copy_loops(0)
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='needs the ffmpeg binary')
+@pytest.mark.parametrize('num_frames', [110250, 128 * 1024])
+def test_decoded_loops_are_exactly_the_clip_length(tmp_path, num_frames, loop_video):
+    sf = pytest.importorskip('soundfile')
+    samplerate = 44100
+    # Whole sine cycles with a rising envelope, so a loop that is too long or too short
+    # shows up as a jump at the seam
+    t = np.arange(num_frames)
+    clip = 0.3 * np.sin(2 * np.pi * round(440 * num_frames / samplerate) * t / num_frames)
+    clip *= np.linspace(0.5, 1, num_frames)
+    input_file = tmp_path / 'clip.wav'
+    output_file = tmp_path / 'out.mp4'
+    sf.write(input_file, np.stack([clip, clip], axis=1), samplerate, subtype='PCM_16')
+
+    # Render from a fresh interpreter, where loop_video can patch for gevent as it would
+    # when run as a script
+    subprocess.run([sys.executable, '-c',
+                    'import sys, loop_video; '
+                    'loop_video.generate_video(sys.argv[1], sys.argv[2], 12, resolution="64x64")',
+                    str(input_file), str(output_file)],
+                   cwd=pathlib.Path(__file__).parents[1], check=True, capture_output=True)
+
+    pcm, _ = (ffmpeg.input(str(output_file))
+              .output('pipe:', format='s16le', ac=1)
+              .run(capture_stdout=True, capture_stderr=True))
+    decoded = np.frombuffer(pcm, dtype='<i2') / 32768
+    loops = loop_video.calculate_required_loops(12, num_frames / samplerate) + 1
+    # A re-encoded stream may end on a partly padded AAC frame
+    assert loops * num_frames <= len(decoded) < loops * num_frames + 1024
+
+    # Skip the first AAC frame, which decodes without the previous frame's overlap
+    expected = np.tile(sf.read(input_file, always_2d=True)[0][:, 0], loops)
+    assert np.abs(decoded[:len(expected)] - expected)[1024:].max() < 0.02
@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+import pytest
+
+sf = pytest.importorskip('soundfile')
+import wav_writer
+from wav_writer import RawWavAppender
+
+
+def stereo_ramp(num_frames):
+    return np.arange(2 * num_frames, dtype=np.int16).reshape(-1, 2)
+
+
+@pytest.mark.parametrize('rf64', [False, True])
+def test_appended_samples_read_back(tmp_path, rf64):
+    path = tmp_path / 'out.wav'
+    data = stereo_ramp(1000)
+    with RawWavAppender(str(path), 44100, channels=2, rf64=rf64) as wav:
+        wav.append(data[:300])
+        wav.append(data[300:].tobytes())
+
+    header_size = wav_writer.RF64_HEADER_SIZE if rf64 else wav_writer.HEADER_SIZE
+    assert os.path.getsize(path) == header_size + data.nbytes
+    with sf.SoundFile(str(path)) as f:
+        assert f.format == ('RF64' if rf64 else 'WAV')
+        assert (f.samplerate, f.channels) == (44100, 2)
+        np.testing.assert_array_equal(f.read(dtype='int16'), data)
+
+
+@pytest.mark.parametrize('kernel_copy', [
+    pytest.param(True, marks=pytest.mark.skipif(not hasattr(os, 'copy_file_range'),
+                                                reason='needs os.copy_file_range')),
+    False,
+])
+def test_append_from_copies_a_file_range(tmp_path, monkeypatch, kernel_copy):
+    if not kernel_copy:
+        monkeypatch.delattr(os, 'copy_file_range', raising=False)
+    source = tmp_path / 'source.raw'
+    data = stereo_ramp(500)
+    source.write_bytes(b'pad' + data.tobytes())
+    path = tmp_path / 'out.wav'
+    with open(source, 'rb') as src, RawWavAppender(str(path), 48000, channels=2) as wav:
+        wav.append(data[:10])
+        wav.append_from(src.fileno(), 3, data.nbytes)
+
+    read, samplerate = sf.read(str(path), dtype='int16')
+    assert samplerate == 48000
+    np.testing.assert_array_equal(read, np.concatenate([data[:10], data]))
+
+
+def test_plain_wav_refuses_data_past_the_header_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(RawWavAppender, 'MAX_DATA_SIZE', 1000)
+    path = tmp_path / 'out.wav'
+    with RawWavAppender(str(path), 44100, channels=2) as wav:
+        wav.append(stereo_ramp(250))
+        with pytest.raises(ValueError):
+            wav.append(stereo_ramp(1))
+    assert sf.info(str(path)).frames == 250
+
+    with RawWavAppender(str(path), 44100, channels=2, rf64=True) as wav:
+        wav.append(stereo_ramp(251))
+    assert sf.info(str(path)).frames == 251
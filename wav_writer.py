@@ -0,0 +1,147 @@
+import os
+import struct
+
+HEADER_SIZE = 44
+RF64_HEADER_SIZE = 80  # HEADER_SIZE plus a 36-byte ds64 chunk
+MAX_DATA_SIZE = 0xFFFFFFFF - (HEADER_SIZE - 8)  # The RIFF size field is 32-bit
+
+def wav_header(data_size, samplerate, channels, sampwidth=2, rf64=False):
+    """
+    Build the RIFF header of a PCM WAV file.
+
+    Plain WAV headers are 44 bytes. RF64 headers (EBU Tech 3306) are 80 bytes: the 32-bit
+    RIFF and data sizes are set to 0xFFFFFFFF and the real sizes go in a ds64 chunk, so
+    the data can grow past 4 GiB.
+
+    Parameters:
+        data_size (int): Size of the sample data in bytes.
+        samplerate (int): Sampling rate in Hz.
+        channels (int): Number of interleaved channels.
+        sampwidth (int): Bytes per sample.
+        rf64 (bool): Build an RF64 header instead of a plain WAV one.
+
+    Returns:
+        bytes: The header.
+    """
+    block_align = channels * sampwidth
+    fmt_chunk = struct.pack(
+        '<4sIHHIIHH',
+        b'fmt ', 16, 1, channels, samplerate,
+        samplerate * block_align, block_align, sampwidth * 8,
+    )
+    if not rf64:
+        return (struct.pack('<4sI4s', b'RIFF', HEADER_SIZE - 8 + data_size, b'WAVE')
+                + fmt_chunk + struct.pack('<4sI', b'data', data_size))
+    return (struct.pack('<4sI4s', b'RF64', 0xFFFFFFFF, b'WAVE')
+            + struct.pack('<4sIQQQI', b'ds64', 28, RF64_HEADER_SIZE - 8 + data_size,
+                          data_size, data_size // block_align, 0)
+            + fmt_chunk + struct.pack('<4sI', b'data', 0xFFFFFFFF))
+
+class RawWavAppender:
+    """
+    Stream raw little-endian PCM samples into a WAV file.
+
+    The RIFF header is written up front with placeholder sizes, samples are appended as
+    raw bytes with no conversion, and the sizes are patched on close. This avoids going
+    through a full audio library for plain 16-bit PCM output. Pass rf64=True for output
+    that may exceed the 4 GiB a plain WAV header can describe.
+
+    Usage:
+        with RawWavAppender('out.wav', 44100, channels=2) as wav:
+            wav.append(int16_frames)
+    """
+    MAX_DATA_SIZE = MAX_DATA_SIZE
+    BUFFER_SIZE = 4 << 20  # Coalesce small appends into few large OS writes
+
+    def __init__(self, filename, samplerate, channels, sampwidth=2, rf64=False):
+        self.samplerate = samplerate
+        self.channels = channels
+        self.sampwidth = sampwidth
+        self.rf64 = rf64
+        self.data_size = 0
+        self.file = open(filename, 'wb', buffering=self.BUFFER_SIZE)
+        self._write_header()
+
+    def _write_header(self):
+        self.file.write(wav_header(self.data_size, self.samplerate, self.channels,
+                                   self.sampwidth, rf64=self.rf64))
+
+    def append(self, buffer):
+        """
+        Append interleaved samples.
+
+        Parameters:
+            buffer: A C-contiguous array or bytes-like object of little-endian samples
+                matching the file's channels and sample width.
+        """
+        data = memoryview(buffer).cast('B')
+        self._check_size(data.nbytes)
+        self.file.write(data)
+        self.data_size += data.nbytes
+
+    def append_from(self, fd, offset, size):
+        """
+        Append bytes copied straight from another open file.
+
+        The copy happens inside the kernel where os.copy_file_range is available (Linux),
+        and through a user-space read/write loop everywhere else.
+
+        Parameters:
+            fd (int): File descriptor of the source file.
+            offset (int): Byte offset of the data in the source file.
+            size (int): Number of bytes to copy.
+        """
+        self._check_size(size)
+        if hasattr(os, 'copy_file_range'):
+            self._copy_in_kernel(fd, offset, size)
+        else:
+            self._copy_in_user_space(fd, offset, size)
+        self.data_size += size
+
+    def _copy_in_kernel(self, fd, offset, size):
+        self.file.flush()
+        out_fd = self.file.fileno()
+        remaining = size
+        while remaining:
+            try:
+                copied = os.copy_file_range(fd, out_fd, remaining, offset_src=offset)
+            except OSError:  # e.g. EXDEV across file systems on older kernels
+                copied = os.sendfile(out_fd, fd, offset, remaining)
+            if copied == 0:
+                raise EOFError("Source file ended before the requested range")
+            offset += copied
+            remaining -= copied
+
+    def _copy_in_user_space(self, fd, offset, size):
+        remaining = size
+        while remaining:
+            data = os.pread(fd, min(remaining, self.BUFFER_SIZE), offset)
+            if not data:
+                raise EOFError("Source file ended before the requested range")
+            self.file.write(data)
+            offset += len(data)
+            remaining -= len(data)
+
+    def _check_size(self, nbytes):
+        """Refuse to grow the data chunk past what a plain 32-bit WAV header can describe."""
+        if not self.rf64 and self.data_size + nbytes > self.MAX_DATA_SIZE:
+            raise ValueError(
+                f"WAV data would reach {self.data_size + nbytes} bytes, over the "
+                f"{self.MAX_DATA_SIZE}-byte limit of the format; open the file with rf64=True"
+            )
+
+    def close(self):
+        """Patch the RIFF and data chunk sizes and close the file."""
+        if self.file.closed:
+            return
+        try:
+            self.file.seek(0)
+            self._write_header()
+        finally:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()